@@ -0,0 +1,49 @@
+import json
+import os
+
+from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
+
+try:
+    import orjson
+
+    def _json_loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN, which the props files use for missing calibration data
+            return json.loads(data)
+except ImportError:
+    from json import loads as _json_loads
+
+
+class _OrjsonLoadMixin:
+    """Parse the backend json files with orjson when it is installed"""
+
+    def _load_json(self, filename):
+        with open(os.path.join(self.dirname, filename), 'rb') as f_json:
+            return _json_loads(f_json.read())
+
+
+def make_fake_backend(name, module, dirname):
+    """Create the V1 and V2 fake backend classes of a device
+
+    Args:
+        name: the name of the device, e.g. 'Huayi12'
+        module: the module the classes are reported in, pass `__name__`
+        dirname: the folder containing conf_{name}.json and props_{name}.json
+
+    Return:
+        (Fake{name}, Fake{name}V2)
+    """
+    attrs = {
+        'dirname': dirname,
+        'conf_filename': 'conf_{}.json'.format(name),
+        'props_filename': 'props_{}.json'.format(name),
+        'backend_name': 'fake_{}'.format(name),
+        '__module__': module,
+    }
+    backend_v1 = type('Fake{}'.format(name),
+                      (_OrjsonLoadMixin, fake_qasm_backend.FakeQasmBackend), attrs)
+    backend_v2 = type('Fake{}V2'.format(name),
+                      (_OrjsonLoadMixin, fake_backend.FakeBackendV2), attrs)
+    return backend_v1, backend_v2
@@ -1,16 +1,99 @@
-import pandas
+import csv
 import json
 import os
+import py_compile
+from functools import cached_property, lru_cache
 from datetime import datetime, timezone, timedelta
 
-from qiskit.providers.models.backendproperties import BackendProperties, Nduv, GateProperties
+from qiskit.providers.models.backendproperties import BackendProperties
 from qiskit.providers.models.backendconfiguration import QasmBackendConfiguration, GateConfig
 from qiskit.circuit.library import *
 
 
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# measurement dates and build times are given in UTC+8
+_TZ = timezone(timedelta(hours=+8))
+
+# Only these columns of the data files are used
+_QUBIT_COLS = ['T1', 'T1_date', 'T2', 'T2_date', 'frequency', 'frequency_date',
+               'readout_error', 'readout_error_date',
+               'prob_meas0_prep1', 'prob_meas0_prep1_date',
+               'prob_meas1_prep0', 'prob_meas1_prep0_date',
+               'readout_length', 'readout_length_date']
+
+_GATE_COLS = ['qubits', 'gate', 'gate_error', 'error_date',
+              'gate_length', 'length_date', 'name']
+
+_INIT_TEMPLATE = """\
+from .{backend_dir} import {cls1}
+from .{backend_dir} import {cls2}
+"""
+
+_BACKEND_TEMPLATE = """\
+import os
+
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
+
+{cls1}, {cls2} = make_fake_backend('{name}', __name__, os.path.dirname(__file__))
+"""
+
+
+def _float(value):
+    # empty cells are missing measurements
+    return float(value) if value else float('nan')
+
+# how each used column is parsed, qubits are stored as json lists, e.g. "[0, 1]"
+_QUBIT_CONVERTERS = {col: str if col.endswith('_date') else _float for col in _QUBIT_COLS}
+_GATE_CONVERTERS = {col: str for col in _GATE_COLS} | {
+    'qubits': json.loads, 'gate_error': _float, 'gate_length': _float}
+
+def _read_csv(path, converters):
+    # the data files are small, the csv module avoids the start-up cost of pandas
+    # rows are yielded one at a time, so large files are never held in memory at once
+    # utf-8-sig also accepts the BOM of Excel's "CSV UTF-8" export, as pandas did
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {col: convert(row[col]) for col, convert in converters.items()}
+
+def _nduv(date, name, unit, value):
+    # same layout as qiskit's Nduv.to_dict()
+    return {'date': date, 'name': name, 'unit': unit, 'value': value}
+
+def _qubit_props(row):
+    # qubit entry of the props dict
+    return [
+        _nduv(row['T1_date'], 'T1', 'ms', row['T1']),
+        _nduv(row['T2_date'], 'T2', 'ms', row['T2']),
+        _nduv(row['frequency_date'], 'frequency', 'MHz', row['frequency']),
+        _nduv(row['readout_error_date'], 'readout_error', '', row['readout_error']),
+        _nduv(row['prob_meas0_prep1_date'], 'prob_meas0_prep1', '', row['prob_meas0_prep1']),
+        _nduv(row['prob_meas1_prep0_date'], 'prob_meas1_prep0', '', row['prob_meas1_prep0']),
+        _nduv(row['readout_length_date'], 'readout_length', 'us', row['readout_length'])
+        ]
+
+def _gate_props(row):
+    # gate entry of the props dict, same layout as GateProperties.to_dict()
+    return {
+        'qubits': row['qubits'],
+        'gate': row['gate'],
+        'parameters': [
+            _nduv(row['error_date'], 'gate_error', '', row['gate_error']),
+            _nduv(row['length_date'], 'gate_length', 'us', row['gate_length'])
+            ],
+        'name': row['name']}
+
+@lru_cache(maxsize=1)
+def _std_gate_map():
+    # qiskit rebuilds this dict on every call
+    return get_standard_gate_name_mapping()
+
 def now_time():
-    tz = timezone(timedelta(hours=+8))
-    return datetime.now(tz).isoformat(timespec='minutes')
+    return datetime.now(_TZ).isoformat(timespec='minutes')
 
 class build_from_file:
     """Build a fake backend with the data files
@@ -39,7 +122,9 @@ class build_from_file:
                  gates_data:str):
 
         self.backend_dir = "fake_{}".format(backend_name)
-        self.backend_absdir = os.path.join(os.path.dirname(__file__), self.backend_dir)
+        self.backend_absdir = os.path.join(_MODULE_DIR, self.backend_dir)
+        # one timestamp for both props and conf of this build
+        self._now = now_time()
 
         if all((
             self.create_init_file(backend_name),
@@ -61,49 +146,32 @@ class build_from_file:
                      qubits_data,
                      gates_data) -> bool:
         try:
-            qubits_info = pandas.read_csv(qubits_data)
-            qubits = []
-            for qubit_id,qubit in qubits_info.iterrows():
-                qubits.append([
-                    Nduv(date=qubit['T1_date'], name='T1', unit='ms', value=qubit['T1']),
-                    Nduv(date=qubit['T2_date'], name='T2', unit='ms', value=qubit['T2']),
-                    Nduv(date=qubit['frequency_date'], name='frequency', unit='MHz', value=qubit['frequency']),
-                    Nduv(date=qubit['readout_error_date'], name='readout_error', unit='', value=qubit['readout_error']),
-                    Nduv(date=qubit['prob_meas0_prep1_date'], name='prob_meas0_prep1', unit='', value=qubit['prob_meas0_prep1']),
-                    Nduv(date=qubit['prob_meas1_prep0_date'], name='prob_meas1_prep0', unit='', value=qubit['prob_meas1_prep0']),
-                    Nduv(date=qubit['readout_length_date'], name='readout_length', unit='us', value=qubit['readout_length'])
-                    ])
+            qubits = [_qubit_props(row) for row in _read_csv(qubits_data, _QUBIT_CONVERTERS)]
                 
             self.n_qubits = len(qubits)
                 
-            gates_info = pandas.read_csv(gates_data)
+            # create_conf only needs the gate names and their qubits
             gates = []
-            for gate_id,gate in gates_info.iterrows():
-                gates.append(GateProperties(
-                    qubits=json.loads(gate['qubits']),
-                    gate=gate['gate'],
-                    parameters=[
-                        Nduv(date=gate['error_date'],name='gate_error',unit='',value=gate['gate_error']),
-                        Nduv(date=gate['length_date'],name='gate_length',unit='us',value=gate['gate_length'])
-                        ],
-                    name=gate['name'])
-                )
-
-            props = BackendProperties(
-                backend_name=backend_name, 
-                backend_version=backend_version, 
-                last_update_date=now_time(), 
-                qubits=qubits, 
-                gates=gates,
-                general=[]).to_dict()
-            
-            props["last_update_date"] = now_time()
-            # qiskit will force last_update_date be datetime.datetime, but it must be a str to be dumped
+            gates_info = []
+            for row in _read_csv(gates_data, _GATE_CONVERTERS):
+                gates.append(_gate_props(row))
+                gates_info.append((row['gate'], row['qubits']))
+            self._gates_info = gates_info
+
+            # the dict layout of BackendProperties.to_dict(), built directly
+            # last_update_date stays a str so that it can be dumped
+            props = {
+                'backend_name': backend_name,
+                'backend_version': backend_version,
+                'last_update_date': self._now,
+                'qubits': qubits,
+                'gates': gates,
+                'general': []}
 
             with open(self.backend_absdir+'/props_'+backend_name+'.json', 'w') as fp:
                 json.dump(props, fp)
-                self.props = BackendProperties.from_dict(props)
-                print("Successfully created props_{}.json".format(backend_name))
+            self._props_dict = props
+            print("Successfully created props_{}.json".format(backend_name))
 
             return True
 
@@ -113,6 +181,18 @@ class build_from_file:
             return False
 
 
+    @cached_property
+    def props(self) -> BackendProperties:
+        """BackendProperties of the built backend, only parsed when accessed"""
+        return BackendProperties.from_dict(self._props_dict)
+
+
+    @cached_property
+    def conf(self) -> QasmBackendConfiguration:
+        """QasmBackendConfiguration of the built backend, only parsed when accessed"""
+        return QasmBackendConfiguration.from_dict(self._conf_dict)
+
+
     def create_conf(self,
                     backend_name,
                     backend_version,
@@ -121,23 +201,25 @@ class build_from_file:
         try:
             n_qubits = self.n_qubits
 
-            gates_info = pandas.read_csv(gates_data)
+            # reuse the (gate, qubits) pairs read in create_props, only read the file when called standalone
+            if getattr(self, "_gates_info", None) is None:
+                self._gates_info = [(row['gate'], row['qubits'])
+                                    for row in _read_csv(gates_data, _GATE_CONVERTERS)]
+            gates_info = self._gates_info
             
-            basis_gates = list(gates_info["gate"].drop_duplicates())
-            if "id" not in basis_gates:
-                basis_gates.append("id")
-            if "reset" not in basis_gates:
-                basis_gates.append("reset")
+            # one pass over the gates: gate -> qubits it acts on, in order of appearance
+            qubits_by_gate = {}
+            for gate_name, qubits in gates_info:
+                qubits_by_gate.setdefault(gate_name, []).append(qubits)
+
+            # id and reset are always supported, appended unless already measured
+            basis_gates = list(dict.fromkeys([*qubits_by_gate, "id", "reset"]))
 
             # So far only consider 1 and 2 qubit gates
-            coupling_map_1 = []
-            coupling_map_2 = []
-            for qubits in list(gates_info["qubits"].drop_duplicates()):
-                q = json.loads(qubits)
-                if len(q) == 1:
-                    coupling_map_1.append(q)
-                if len(q) == 2:
-                    coupling_map_2.append(q)
+            # qubits are parsed into lists on read, dedupe them as tuples
+            unique_qubits = dict.fromkeys(tuple(qubits) for _, qubits in gates_info)
+            coupling_map_1 = [list(q) for q in unique_qubits if len(q) == 1]
+            coupling_map_2 = [list(q) for q in unique_qubits if len(q) == 2]
 
             """
             Definition of <gates> configurations requires OpenQASM
@@ -149,10 +231,11 @@ class build_from_file:
             In addition, .qasm() will be depracted
             """
             gates = []
+            std_gates = _std_gate_map()
             for gate_name in basis_gates:
                 try:
-                    gate = get_standard_gate_name_mapping()[gate_name]
-                    cmap = list(gates_info.loc[gates_info["gate"]==gate_name, "qubits"])
+                    gate = std_gates[gate_name]
+                    cmap = qubits_by_gate.get(gate_name, [])
                     params = [p.name for p in gate.params]
                     if gate.num_qubits == 1:
                         gates.append(GateConfig(
@@ -187,14 +270,14 @@ class build_from_file:
                 memory=True,
                 max_shots=6000,
                 coupling_map=coupling_map_2,
-                online_date=now_time(), # somehow oneline_date must be defined to create the backend
+                online_date=self._now, # somehow oneline_date must be defined to create the backend
                 description="{} qubit device".format(n_qubits),
                 ).to_dict()
 
             with open(self.backend_absdir+'/conf_'+backend_name+'.json', 'w') as fp:
                 json.dump(conf, fp)
-                self.conf = QasmBackendConfiguration.from_dict(conf)
-                print("Successfully created conf_{}.json".format(backend_name))
+            self._conf_dict = conf
+            print("Successfully created conf_{}.json".format(backend_name))
 
             return True
 
@@ -213,36 +296,33 @@ class build_from_file:
             backend_name1 = "Fake{}".format(backend_name)
             backend_name2 = "Fake{}V2".format(backend_name)
             
-            with open(self.backend_absdir+"/__init__.py",'w') as f:
-                f.write("from .{0} import {1}\n".format(self.backend_dir, backend_name1))
-                f.write("from .{0} import {1}\n".format(self.backend_dir, backend_name2))
+            init_file = self.backend_absdir+"/__init__.py"
+            backend_file = self.backend_absdir+"/fake_{}.py".format(backend_name)
+
+            with open(init_file,'w') as f:
+                f.write(_INIT_TEMPLATE.format(backend_dir=self.backend_dir,
+                                              cls1=backend_name1,
+                                              cls2=backend_name2))
     
-            with open(self.backend_absdir+"/fake_{}.py".format(backend_name),'w') as f:
-                f.write("import os\n")
-                f.write("from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend\n")
-                
-                f.write("\nclass {}(fake_qasm_backend.FakeQasmBackend):\n".format(backend_name1))
-                f.write("\tdirname = os.path.dirname(__file__)\n")
-                f.write("\tconf_filename = 'conf_{}.json'\n".format(backend_name))
-                f.write("\tprops_filename = 'props_{}.json'\n".format(backend_name))
-                f.write("\tbackend_name = 'fake_{}'\n".format(backend_name))
-                
-                f.write("\nclass {}(fake_backend.FakeBackendV2):\n".format(backend_name2))
-                f.write("\tdirname = os.path.dirname(__file__)\n".format(backend_name))
-                f.write("\tconf_filename = 'conf_{}.json'\n".format(backend_name))
-                f.write("\tprops_filename = 'props_{}.json'\n".format(backend_name))
-                f.write("\tbackend_name = 'fake_{}'\n".format(backend_name))
+            with open(backend_file,'w') as f:
+                f.write(_BACKEND_TEMPLATE.format(name=backend_name,
+                                                 cls1=backend_name1,
+                                                 cls2=backend_name2))
+
+            # write the bytecode to __pycache__ now, so the first import skips parsing
+            py_compile.compile(init_file)
+            py_compile.compile(backend_file)
 
-                self.backend_names = [backend_name1, backend_name2]
+            self.backend_names = [backend_name1, backend_name2]
 
             isimported = False
-            with open(os.path.dirname(__file__)+"/__init__.py", 'r') as f:
+            with open(os.path.join(_MODULE_DIR, "__init__.py"), 'r') as f:
                 lines = f.readlines()
                 for line in lines:
                     if "from .{} import *".format(self.backend_dir) in line:
                         isimported = True
             if not isimported:
-                with open(os.path.dirname(__file__)+"/__init__.py", 'a') as f:
+                with open(os.path.join(_MODULE_DIR, "__init__.py"), 'a') as f:
                     f.write("\nfrom .{} import *".format(self.backend_dir))
             
             return True
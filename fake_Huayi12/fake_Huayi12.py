@@ -1,14 +1,9 @@
 import os
-from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
 
-class FakeHuayi12(fake_qasm_backend.FakeQasmBackend):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi12.json'
-	props_filename = 'props_Huayi12.json'
-	backend_name = 'fake_Huayi12'
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
 
-class FakeHuayi12V2(fake_backend.FakeBackendV2):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi12.json'
-	props_filename = 'props_Huayi12.json'
-	backend_name = 'fake_Huayi12'
+FakeHuayi12, FakeHuayi12V2 = make_fake_backend('Huayi12', __name__, os.path.dirname(__file__))
@@ -1,14 +1,9 @@
 import os
-from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
 
-class FakeHuayi32_LE(fake_qasm_backend.FakeQasmBackend):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi32_LE.json'
-	props_filename = 'props_Huayi32_LE.json'
-	backend_name = 'fake_Huayi32_LE'
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
 
-class FakeHuayi32_LEV2(fake_backend.FakeBackendV2):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi32_LE.json'
-	props_filename = 'props_Huayi32_LE.json'
-	backend_name = 'fake_Huayi32_LE'
+FakeHuayi32_LE, FakeHuayi32_LEV2 = make_fake_backend('Huayi32_LE', __name__, os.path.dirname(__file__))
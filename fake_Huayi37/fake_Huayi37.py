@@ -1,14 +1,9 @@
 import os
-from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
 
-class FakeHuayi37(fake_qasm_backend.FakeQasmBackend):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi37.json'
-	props_filename = 'props_Huayi37.json'
-	backend_name = 'fake_Huayi37'
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
 
-class FakeHuayi37V2(fake_backend.FakeBackendV2):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi37.json'
-	props_filename = 'props_Huayi37.json'
-	backend_name = 'fake_Huayi37'
+FakeHuayi37, FakeHuayi37V2 = make_fake_backend('Huayi37', __name__, os.path.dirname(__file__))
@@ -1,14 +1,9 @@
 import os
-from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
 
-class FakeHuayi30(fake_qasm_backend.FakeQasmBackend):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi30.json'
-	props_filename = 'props_Huayi30.json'
-	backend_name = 'fake_Huayi30'
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
 
-class FakeHuayi30V2(fake_backend.FakeBackendV2):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi30.json'
-	props_filename = 'props_Huayi30.json'
-	backend_name = 'fake_Huayi30'
+FakeHuayi30, FakeHuayi30V2 = make_fake_backend('Huayi30', __name__, os.path.dirname(__file__))
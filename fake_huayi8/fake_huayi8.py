@@ -1,14 +1,9 @@
 import os
-from qiskit.providers.fake_provider import fake_qasm_backend, fake_backend
 
-class FakeHuayi8(fake_qasm_backend.FakeQasmBackend):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi8.json'
-	props_filename = 'props_Huayi8.json'
-	backend_name = 'fake_Huayi8'
+try:
+    from .._fake_factory import make_fake_backend
+except ImportError:
+    # the device folder is imported at top level, e.g. `from fake_Huayi35 import FakeHuayi35`
+    from _fake_factory import make_fake_backend
 
-class FakeHuayi8V2(fake_backend.FakeBackendV2):
-	dirname = os.path.dirname(__file__)
-	conf_filename = 'conf_Huayi8.json'
-	props_filename = 'props_Huayi8.json'
-	backend_name = 'fake_Huayi8'
+FakeHuayi8, FakeHuayi8V2 = make_fake_backend('Huayi8', __name__, os.path.dirname(__file__))
@@ -2,16 +2,32 @@ import os
 import json
 import pandas as pd
 
-from qiskit import transpile, execute
+from qiskit import transpile
 from qiskit.circuit.library import QuantumVolume as QuantumVolumeCircuit
 from qiskit.quantum_info import Statevector
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter_ns
 from datetime import timedelta
-from IPython.display import display, clear_output
+
+try:
+    import orjson
+
+    def _json_dump(obj, fp):
+        fp.write(orjson.dumps(obj))
+except ImportError:
+    def _json_dump(obj, fp):
+        fp.write(json.dumps(obj, separators=(',', ':')).encode())
+
+def _write_json(path, obj):
+    with open(path, "wb") as f:
+        _json_dump(obj, f)
+
+
+# below this width the statevector simulation is cheaper than starting worker processes
+PARALLEL_MIN_QUBITS = 10
 
 
 def get_heavy_outputs(counts):
@@ -21,12 +37,34 @@ def get_heavy_outputs(counts):
     Returns:
         list: All states with measurement probability greater than the mean.
     """
-    # sort the keys of `counts` by value of counts.get(key)
-    sorted_counts = sorted(counts.keys(), key=counts.get)
-    # discard results with probability < median
-    heavy_outputs = sorted_counts[len(sorted_counts)//2:]
+    if not counts:
+        return []
+    keys = np.fromiter(counts.keys(), dtype=object, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    # partition around the median instead of sorting, discard results with probability < median
+    k = len(values)//2
+    heavy_outputs = keys[np.argpartition(values, k)[k:]].tolist()
     return heavy_outputs
 
+def _ideal_heavy_mask(circuit):
+    """Heavy outputs of the noiseless circuit as a mask over the basis states, run in the worker processes.
+
+    The heavy outputs are the basis states with ideal probability above the median, entry `i`
+    is the bitstring `format(i, f"0{n}b")`. The circuit is simulated before `measure_all`,
+    so there are no measurements to strip.
+    """
+    state_vector = Statevector.from_instruction(circuit)
+    probs = state_vector.probabilities()
+    k = probs.size // 2
+    # one byte per basis state, smaller than the heavy indices and looked up without a search
+    heavy_mask = np.zeros(probs.size, dtype=bool)
+    heavy_mask[np.argpartition(probs, k)[k:]] = True
+    return heavy_mask
+
+def _two_qubit_gate_count(circuit):
+    """Number of 2-qubit gates, the dominant cost of a transpiled circuit."""
+    return sum(1 for inst in circuit.data if inst.operation.num_qubits == 2)
+
 def check_threshold(n_heavies, n_circuits, n_shots):
     """Evaluate adjusted threshold inequality for quantum volume.
     Args:
@@ -42,90 +80,144 @@ def check_threshold(n_heavies, n_circuits, n_shots):
     numerator = n_heavies - 2*sqrt(n_heavies*(n_shots-(n_heavies/n_circuits)))
     return bool(numerator/(n_circuits*n_shots) > 2/3)
 
-def test_qv(device, n_qubits, n_circuits, n_shots, outputdir=None):
+def test_qv(device, n_qubits, n_circuits, n_shots, outputdir=None,
+            n_transpile_passes=1, dump_circuits=False, dump_transpiled=False):
     """Try to achieve 2**n_qubits quantum volume on device.
     Args:
         device (qiskit.providers.Backend): Device to test.
         n_qubits (int): Number of qubits to use for test.
         n_circuits (int): Number of different circuits to run on the device.
         n_shots (int): Number of shots per circuit.
+        n_transpile_passes (int): Number of seeded transpilations per circuit,
+            the one with the fewest 2-qubit gates is run. Defaults to 1.
+        dump_circuits (bool): Add the QASM of each QV circuit to its
+            circuit_#.json in outputdir. Defaults to False.
+        dump_transpiled (bool): Add the QASM of each transpiled circuit to its
+            circuit_#.json in outputdir. Defaults to False.
     Returns:
         Dictonary of the results
     """
-    from numpy import sqrt
 
-    def get_ideal_probabilities(circuit):
-        """Simulates circuit behaviour on a device with no errors."""
-        state_vector = Statevector.from_instruction(
-            circuit.remove_final_measurements(inplace=False)
-            )
-        return state_vector.probabilities_dict()
-
-    def get_real_counts(circuit, backend, shots):
-        """Runs circuit on device and returns counts dict."""
+    def get_real_counts(circuits, backend, shots):
+        """Runs circuits on device as one job and returns a counts dict for each."""
         # Somehow the optimization_level cannot be 3
-        t_circuit = transpile(circuit, backend, optimization_level=2)
+        if n_transpile_passes > 1:
+            # routing is stochastic, keep the shortest of several seeded passes
+            candidates = [
+                transpile(circuits, backend, optimization_level=2, seed_transpiler=seed)
+                for seed in range(n_transpile_passes)
+            ]
+            t_circuits = [
+                min(passes, key=_two_qubit_gate_count) for passes in zip(*candidates)
+            ]
+        else:
+            t_circuits = transpile(circuits, backend, optimization_level=2)
+        # only the counts are used, per-shot memory is not requested
         job = backend.run(
-            t_circuit, shots=shots, memory=True
+            t_circuits, shots=shots
             )
-        return job.result().get_counts(), t_circuit
+        result = job.result()
+        return [result.get_counts(i) for i in range(len(t_circuits))], t_circuits
 
     # time it
-    start_time = timer()
+    start_ns = perf_counter_ns()
 
     # generate set of random circuits
     qv_circuits = [
         QuantumVolumeCircuit(n_qubits) for c in range(n_circuits)
     ]
 
-    n_heavies = [0]*n_circuits  # number of measured heavy outputs
-    cum_HOP = [0]*n_circuits  # cumulant heavy-output percentage
-    cum_2sigma = [0]*n_circuits  # cumulant 2-sigma deviation
-    transpiled_circuits = []
-
+    n_heavies = np.zeros(n_circuits, dtype=np.int64)  # number of measured heavy outputs
+
+    # simulate circuits, the circuits are independent so spread them over processes
+    if n_qubits >= PARALLEL_MIN_QUBITS and n_circuits > 1:
+        # the pool may still be pickling the circuits, so measured copies are run
+        measured_circuits = [
+            circuit.measure_all(inplace=False) for circuit in qv_circuits
+        ]
+        # transpile() runs its own process pool at the same time, leave it half of the cores
+        n_workers = max(1, (os.cpu_count() or 1) // 2)
+        # a few circuits per task, cuts the inter-process round trips
+        chunksize = max(1, n_circuits // (2 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            heavy_masks_iter = executor.map(
+                _ideal_heavy_mask, qv_circuits, chunksize=chunksize)
+            # transpile and run all circuits in one batch while the workers simulate
+            real_counts_list, transpiled_circuits = get_real_counts(
+                measured_circuits, device, n_shots)
+            heavy_masks = list(heavy_masks_iter)
+    else:
+        heavy_masks = [
+            _ideal_heavy_mask(circuit) for circuit in qv_circuits
+        ]
+        # simulated already, the circuits can be measured in place
+        for circuit in qv_circuits:
+            circuit.measure_all()
+        measured_circuits = qv_circuits
+        # transpile and run all circuits in one batch
+        real_counts_list, transpiled_circuits = get_real_counts(
+            measured_circuits, device, n_shots)
+
+    # circuits are processed as a batch, each one is accounted an equal share of the time
+    # timings are kept in integer nanoseconds and formatted once
+    circ_ns = perf_counter_ns() - start_ns
+    elapsed_time_circ = str(timedelta( microseconds = circ_ns / n_circuits / 1000 ))
+
+    fmt = f"0{n_qubits}b"
     circ_results = []
-    circ_timer_in_sec = 0.0
-    for i, circuit in enumerate(qv_circuits):
-        
-        start_time_circ = timer()
-        
-        # simulate circuit
-        ideal_heavy_outputs = get_heavy_outputs(
-            get_ideal_probabilities(circuit)
-        )
-
-        circuit.measure_all()
-        real_counts, t_circuit = get_real_counts(circuit, device, n_shots)
-        transpiled_circuits.append(t_circuit)
-        # record whether device result is in the heavy outputs
-        for output, count in real_counts.items():
-            if output in ideal_heavy_outputs:
-                n_heavies[i] += count
-                
-        elapsed_time_circ = timedelta( seconds = timer() - start_time_circ )
-        circ_timer_in_sec += elapsed_time_circ.total_seconds()
-        
-        circ_result = {
-            "ideal_heavy_outputs" : ideal_heavy_outputs,
-            "n_heavy" : n_heavies[i],
-            "n_shots" : n_shots,
-            "HOP" : n_heavies[i] / n_shots,
-            "elapsed_time" : str(elapsed_time_circ),
-        }
-        
-        # export circuit and test results to <circuit_#.json>
-        if outputdir != None:
-            with open(f"{outputdir}/circuit_{i}.json", "w") as f:
-                json.dump(
-                    circ_result | {
-                        "qv_circuit" : circuit.qasm(),
-                        "transpiled_circuit" : t_circuit.qasm()},
-                    f)
-        
-        circ_results.append( circ_result | { 
-            "circuit_data_file": f"circuit_{i}.json"} )        
-        cum_HOP[i] = sum(n_heavies[0:i+1]) / n_shots / (i+1) * 100
-        cum_2sigma[i] = 2 * sqrt( cum_HOP[i] * ( 100.0 - cum_HOP[i] ) / (i+1) )
+    # the circuit files are written in the background while the next results are scored
+    writes = []
+    with ThreadPoolExecutor(max_workers=2) as writer:
+        for i, circuit in enumerate(measured_circuits):
+
+            heavy_mask = heavy_masks[i]
+            real_counts = real_counts_list[i]
+            t_circuit = transpiled_circuits[i]
+
+            # record whether device result is in the heavy outputs, all outcomes at once
+            # only the observed outcomes are converted, by their basis state index
+            outputs = np.fromiter(
+                (int(output, 2) for output in real_counts), dtype=np.int64, count=len(real_counts))
+            counts = np.fromiter(real_counts.values(), dtype=np.int64, count=len(real_counts))
+            is_heavy = heavy_mask[outputs]
+            n_heavy = int(counts[is_heavy].sum())
+            n_heavies[i] = n_heavy
+
+            # export circuit and test results to <circuit_#.json>
+            # the heavy bitstrings are only needed for the files, half of 2**n strings per circuit
+            if outputdir != None:
+                ideal_heavy_outputs = [
+                    format(j, fmt) for j in np.flatnonzero(heavy_mask).tolist()]
+
+                circ_result = {
+                    "ideal_heavy_outputs" : ideal_heavy_outputs,
+                    "n_heavy" : n_heavy,
+                    "n_shots" : n_shots,
+                    "HOP" : n_heavy / n_shots,
+                    "elapsed_time" : elapsed_time_circ,
+                }
+
+                # the QASM strings are large at high n, only build them on request
+                circ_data = dict(circ_result)
+                if dump_circuits:
+                    circ_data["qv_circuit"] = circuit.qasm()
+                if dump_transpiled:
+                    circ_data["transpiled_circuit"] = t_circuit.qasm()
+                writes.append(writer.submit(
+                    _write_json, f"{outputdir}/circuit_{i}.json", circ_data))
+
+                circ_results.append({
+                    **circ_result,
+                    "circuit_data_file": f"circuit_{i}.json"})
+        # raise any error from writing the files
+        for write in writes:
+            write.result()
+
+    # cumulant heavy-output percentage and its 2-sigma deviation after each circuit
+    n_done = np.arange(1, n_circuits+1)
+    cum_HOP = np.cumsum(n_heavies) / n_shots / n_done * 100
+    cum_2sigma = 2 * np.sqrt( cum_HOP * ( 100.0 - cum_HOP ) / n_done )
+    cum_HOP, cum_2sigma = cum_HOP.tolist(), cum_2sigma.tolist()
 
     # export the summary results to <summary.csv>
     if outputdir != None:
@@ -136,13 +228,12 @@ def test_qv(device, n_qubits, n_circuits, n_shots, outputdir=None):
                 "n_heavy", "n_shots", "HOP", 
                 "elapsed_time", "circuit_data_file"]
         )
-        with open(f"{outputdir}/summary.csv", "w") as f:
-            result_df.to_csv(f)
+        result_df.to_csv(f"{outputdir}/summary.csv")
 
     # do statistical check to see if device passes test
     is_pass = bool( (cum_HOP[-1]-cum_2sigma[-1]) > (100*2/3) )
 
-    elapsed_time = timedelta( seconds = timer() - start_time )
+    elapsed_time = timedelta( microseconds = (perf_counter_ns() - start_ns) / 1000 )
 
     results = {
         "backend":device.name() if callable(device.name) else device.name,
@@ -156,8 +247,7 @@ def test_qv(device, n_qubits, n_circuits, n_shots, outputdir=None):
         "cum_HOP":cum_HOP,
         "cum_2sigma":cum_2sigma,
         "elapsed_time": str(elapsed_time),
-        "elapsed_time_per_circuit": str(timedelta(
-            seconds=circ_timer_in_sec/n_circuits)),
+        "elapsed_time_per_circuit": elapsed_time_circ,
     }
 
     print(
@@ -171,7 +261,8 @@ def test_qv(device, n_qubits, n_circuits, n_shots, outputdir=None):
 
 def test_qv_for_depths(
     backend, depths, n_circuits, n_shots, 
-    subdirname, dirname="QV_Results"):
+    subdirname, dirname="QV_Results", n_transpile_passes=1,
+    dump_circuits=False, dump_transpiled=False):
     """Sweep the QV for different depths
 
     Args:
@@ -181,6 +272,9 @@ def test_qv_for_depths(
         n_shots: number of shots for each random circuit
         filename: filename for the stored results
         dirname: (default: QV_Results) automatically create a folder to save the results
+        n_transpile_passes: (default: 1) seeded transpilations per circuit, see test_qv
+        dump_circuits: (default: False) store the QASM of the random circuits, see test_qv
+        dump_transpiled: (default: False) store the QASM of the transpiled circuits, see test_qv
 
     Returns:
         results_df: A dataframe including the qv_test results as well as the random circuits
@@ -190,7 +284,12 @@ def test_qv_for_depths(
     if not os.path.isdir(f"./{dirname}/{subdirname}"):
         os.mkdir(f"./{dirname}/{subdirname}")
 
-    results_device_df = pd.DataFrame()
+    summary_columns = [
+        "backend", "n_qubits", "QV", "HOP",
+        "2sigma", "success", "n_circuits",
+        "n_shots", "elapsed_time",
+        "elapsed_time_per_circuit"]
+    rows = []
 
     for depth in depths:
         dir_depth = f"./{dirname}/{subdirname}/depth_{depth}"
@@ -198,23 +297,16 @@ def test_qv_for_depths(
             os.mkdir(dir_depth)
         result = test_qv(
             backend, depth, n_circuits, n_shots,
-            outputdir=dir_depth)
-        
-        results_device_df = pd.concat([
-            results_device_df,
-            pd.DataFrame(
-                result, 
-                columns=[
-                    "backend", "n_qubits", "QV", "HOP", 
-                    "2sigma", "success", "n_circuits",
-                    "n_shots", "elapsed_time",
-                    "elapsed_time_per_circuit"],
-                index=[0])],
-            ignore_index=True)
+            outputdir=dir_depth, n_transpile_passes=n_transpile_passes,
+            dump_circuits=dump_circuits, dump_transpiled=dump_transpiled)
         
+        rows.append({col: result[col] for col in summary_columns})
+
+    # build the summary once, concatenating per depth copies the frame every time
+    results_device_df = pd.DataFrame(rows, columns=summary_columns)
+
     # export summary filr for each device test
-    with open(f"{dirname}/{subdirname}/summary.csv","w") as f:
-        results_device_df.to_csv(f, index=None)
+    results_device_df.to_csv(f"{dirname}/{subdirname}/summary.csv", index=None)
         
     return results_device_df
 
@@ -227,6 +319,8 @@ def qv_plot(result):
     Args:
         result (dict): result of qv_test for one depth
     """
+    # imported here, the test functions do not need the plotting stack
+    import matplotlib.pyplot as plt
     
     x = np.array( range(result["n_circuits"]) )
     y = np.array( result["cum_HOP"] )
@@ -257,19 +351,26 @@ def qv_list_plot(
     Note:
         The data should be strored as "{dirname}/QV_{backend}_{depth}.json"
     """
+    import matplotlib.pyplot as plt
+    from IPython.display import display
     
     if isinstance(backend_list, str):
         backend_list = [backend_list]
     
+    # read every summary once up front, the reads are I/O bound and can overlap
+    paths = [f"{dirname}/QV_{backend}/summary.csv" for backend in backend_list]
+    with ThreadPoolExecutor() as executor:
+        summaries = list(executor.map(
+            lambda path: pd.read_csv(path, index_col=0), paths))
+
     fig = plt.figure()
     
-    for backend in backend_list:
-        with open(f"{dirname}/QV_{backend}/summary.csv", 'r') as f:
-            df = pd.read_csv(f, index_col=0)
-        if depths == None: depths = df['n_qubits'].values
-        hop = df['HOP'].values
-        h_low = df['HOP'].values - df['2sigma'].values
-        h_high = df['HOP'].values + df['2sigma'].values
+    for backend, df in zip(backend_list, summaries):
+        if depths is None: depths = df['n_qubits'].to_numpy()
+        hop = df['HOP'].to_numpy()
+        two_sigma = df['2sigma'].to_numpy()
+        h_low = hop - two_sigma
+        h_high = hop + two_sigma
         p_hop = plt.plot( depths, hop, label=backend )
         p_err = plt.fill_between( depths, h_low, h_high, color=p_hop[0].get_color(), alpha=0.2)
         plt.legend()
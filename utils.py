@@ -1,31 +1,43 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+_BASIS_GATES = {
+    "rxrxcz": (
+        "id",
+        "rx",
+        "ry",
+        "cz",
+        "reset"),
+    "rrzrzz": (
+        "id",
+        "r",
+        "rz",
+        "rzz",
+        "reset"),
+}
+
 def common_basis_gates(gates_set_name):
-    if gates_set_name == "rxrxcz":
-        basis_gates = [
-            "id",
-            "rx",
-            "ry",
-            "cz",
-            "reset"]
-    elif gates_set_name == "rrzrzz":
-        basis_gates = [
-            "id",
-            "r",
-            "rz",
-            "rzz",
-            "reset"]
+    if gates_set_name in _BASIS_GATES:
+        # a new list each call, callers may extend it
+        basis_gates = list(_BASIS_GATES[gates_set_name])
     else:
         basis_gates = []
         print("Basis set's name not found.")
     return basis_gates
 
+@lru_cache(maxsize=None)
+def _finite_connected_pairs(n_qubits, radius):
+    # all ordered pairs (i,j), i != j, with |i-j| <= radius, in row-major order
+    idx = np.arange(n_qubits)
+    i, j = np.meshgrid(idx, idx, indexing='ij')
+    mask = (i != j) & (np.abs(i - j) <= radius)
+    pairs = np.stack([i[mask], j[mask]], axis=1)
+    pairs.flags.writeable = False
+    return pairs
+
 def finite_connected_map(n_qubits, radius):
-    if radius <= n_qubits:
-        coupling_map = [[i,j]
-                        for i in range(n_qubits) 
-                        for j in list(range(max(0,i-radius),i)) + 
-                        list(range(i+1,min(i+1+radius,n_qubits)))]
-    else:
-        coupling_map = [[i,j]
-                        for i in range(n_qubits) 
-                        for j in list(range(i))+list(range(i+1,n_qubits))]
+    # the pairs are cached per (n_qubits, radius), callers get their own list to modify
+    coupling_map = _finite_connected_pairs(n_qubits, radius).tolist()
     return coupling_map
\ No newline at end of file